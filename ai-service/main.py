@@ -1,14 +1,44 @@
 from fastapi import FastAPI, File, UploadFile
 from fastapi.responses import JSONResponse, FileResponse
 from pathlib import Path
-import uuid, shutil, json, subprocess, re
+from datetime import date, datetime
+import uuid, json, re, hashlib, os, threading, asyncio, logging
+import aiofiles
+import httpx
+import xlsxwriter
+from python_calamine import CalamineWorkbook
+import numpy as np
 import pandas as pd
 
 app = FastAPI()
+logger = logging.getLogger(__name__)
 
 # ---------- storage ----------
 JOBS_DIR = Path("./jobs")
 JOBS_DIR.mkdir(parents=True, exist_ok=True)
+PLAN_CACHE_DIR = JOBS_DIR / "_plan_cache"
+PLAN_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+INSTRUCTIONS_MAX_CHARS = 4000  # planner only ever sees this much instruction text
+
+# Rust-backed reader (python-calamine, pandas>=2.2); much faster than openpyxl's cell tree
+EXCEL_ENGINE = "calamine"
+# Arrow-backed strings: .str ops run as vectorized Arrow kernels (needs pyarrow)
+ARROW_STRING = "string[pyarrow]"
+
+# ---------- local LLM (Ollama HTTP API) ----------
+OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_MODEL = "llama3:instruct"
+OLLAMA_NUM_PREDICT = 1024
+# bump whenever the prompt or decoding changes so plans from older prompts aren't replayed
+PLAN_PROMPT_VERSION = "v4-unwrapped-filter-format-json"
+
+# semantic plan cache (optional: needs sentence-transformers + faiss-cpu)
+SEMANTIC_MODEL_NAME = "all-MiniLM-L6-v2"
+SEMANTIC_DIM = 384
+SEMANTIC_THRESHOLD = 0.95
+_semantic_state = None  # dict once loaded, False if unavailable
+_semantic_lock = threading.Lock()
 
 # ---------- health ----------
 @app.get("/health")
@@ -25,81 +55,320 @@ def read_instructions_text(job_dir: Path) -> str:
     try:
         if suffix == ".pdf":
             import fitz  # PyMuPDF
-            doc = fitz.open(instr)
-            return "\n".join(page.get_text() for page in doc)
+            # stop extracting pages once the planner's input budget is covered
+            parts, total = [], 0
+            with fitz.open(instr) as doc:
+                for page in doc:
+                    text = page.get_text("text")
+                    parts.append(text)
+                    total += len(text) + 1
+                    if total >= INSTRUCTIONS_MAX_CHARS:
+                        break
+            return "\n".join(parts)
         elif suffix in (".xlsx", ".xls"):
-            df = pd.read_excel(instr)
-            return "\n".join(df.astype(str).fillna("").values.flatten())
+            wb = CalamineWorkbook.from_path(str(instr))
+            rows = wb.get_sheet_by_index(0).to_python()
+            return "\n".join(str(c) for row in rows for c in row if c is not None and c != "")
         else:
             return instr.read_text(errors="ignore")
     except Exception as e:
         return f"[INSTRUCTIONS_READ_ERROR] {e}"
 
 def call_ollama(prompt: str) -> str:
-    """Call local Llama 3 via Ollama (ensure `ollama pull llama3:instruct`)."""
-    proc = subprocess.run(
-        ["ollama", "run", "llama3:instruct"],
-        input=prompt,
-        text=True,
-        capture_output=True
-    )
-    if proc.returncode != 0:
-        raise RuntimeError(f"Ollama error: {proc.stderr.strip() or proc.stdout}")
-    return proc.stdout
-
-def extract_json_block(text: str) -> str:
-    """Extract JSON from model output (tries fenced ```json blocks first)."""
-    m = re.search(r"```json\s*(\{.*?\})\s*```", text, re.DOTALL)
-    if m:
-        return m.group(1).strip()
-    # fallback: find the first {...} JSON-looking block
-    m2 = re.search(r"(\{.*\})", text, re.DOTALL)
-    return m2.group(1).strip() if m2 else ""
+    """Call local Llama 3 via Ollama's HTTP API (ensure `ollama pull llama3:instruct`).
+
+    format="json" constrains decoding to a single JSON value (no fences or prose);
+    the stream is still cut as soon as the top-level {...} closes.
+    """
+    body = {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": True,
+        "format": "json",
+        "options": {"num_predict": OLLAMA_NUM_PREDICT},
+    }
+    parts = []
+    depth, in_str, escaped, closed = 0, False, False, False
+    try:
+        with httpx.stream("POST", OLLAMA_URL, json=body, timeout=120) as resp:
+            if resp.status_code != 200:
+                raise RuntimeError(f"Ollama error: HTTP {resp.status_code} {resp.read().decode(errors='ignore').strip()}")
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                piece = chunk.get("response", "")
+                parts.append(piece)
+                # bracket-depth scan (ignores braces inside JSON strings)
+                for ch in piece:
+                    if in_str:
+                        if escaped:
+                            escaped = False
+                        elif ch == "\\":
+                            escaped = True
+                        elif ch == '"':
+                            in_str = False
+                    elif ch == '"' and depth > 0:
+                        in_str = True
+                    elif ch == "{":
+                        depth += 1
+                    elif ch == "}" and depth > 0:
+                        depth -= 1
+                        if depth == 0:
+                            closed = True
+                            break
+                if closed or chunk.get("done"):
+                    break
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"Ollama error: {e}") from e
+    return "".join(parts)
+
+def _atomic_write_text(path: Path, text: str):
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+def _plan_cache_key(raw_cols, ideal_cols, instructions_text: str) -> str:
+    """SHA-256 over the planner inputs (prompt version, column sets, truncated instructions)."""
+    payload = json.dumps([
+        PLAN_PROMPT_VERSION,
+        sorted(map(str, raw_cols)),
+        sorted(map(str, ideal_cols)),
+        instructions_text[:INSTRUCTIONS_MAX_CHARS],
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _is_cacheable_plan(plan_json: str) -> bool:
+    """Only replay plans that actually map something ({} / empty mappings would pin the fallback)."""
+    try:
+        plan = json.loads(plan_json)
+    except ValueError:
+        return False
+    mappings = plan.get("mappings") if isinstance(plan, dict) else None
+    return isinstance(mappings, list) and len(mappings) > 0
+
+def load_cached_plan(key: str) -> str:
+    """Return a previously stored plan JSON for this key, or "" on miss."""
+    path = PLAN_CACHE_DIR / f"{key}.json"
+    try:
+        plan_json = path.read_text()
+    except OSError:
+        return ""
+    return plan_json if _is_cacheable_plan(plan_json) else ""
+
+def save_cached_plan(key: str, plan_json: str):
+    """Store plan JSON atomically (write temp file, then os.replace)."""
+    _atomic_write_text(PLAN_CACHE_DIR / f"{key}.json", plan_json)
+
+def _column_signature(raw_cols, ideal_cols) -> str:
+    """Hash of prompt version + raw/ideal column sets; semantic hits must match it exactly."""
+    payload = json.dumps([PLAN_PROMPT_VERSION, sorted(map(str, raw_cols)), sorted(map(str, ideal_cols))])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _semantic_index():
+    """Lazy-load MiniLM + the FAISS index from PLAN_CACHE_DIR (None if unavailable)."""
+    global _semantic_state
+    if _semantic_state is None:
+        try:
+            import faiss
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(SEMANTIC_MODEL_NAME)
+            index_path = PLAN_CACHE_DIR / "index.faiss"
+            meta_path = PLAN_CACHE_DIR / "index_meta.json"
+            if index_path.exists() and meta_path.exists():
+                index = faiss.read_index(str(index_path))
+                meta = json.loads(meta_path.read_text())
+                # row i of meta describes vector i; a torn write breaks that pairing
+                if index.ntotal != len(meta):
+                    index, meta = faiss.IndexFlatIP(SEMANTIC_DIM), []
+            else:
+                index, meta = faiss.IndexFlatIP(SEMANTIC_DIM), []
+            _semantic_state = {"faiss": faiss, "model": model, "index": index, "meta": meta}
+        except Exception:
+            _semantic_state = False
+    return _semantic_state or None
+
+def _embed_instructions(model, instructions_text: str) -> np.ndarray:
+    # normalized vectors → inner product == cosine similarity
+    vec = model.encode([instructions_text[:INSTRUCTIONS_MAX_CHARS]], normalize_embeddings=True)
+    return np.asarray(vec, dtype="float32")
+
+def find_similar_plan(raw_cols, ideal_cols, instructions_text: str) -> str:
+    """Reuse a stored plan whose instructions embed within SEMANTIC_THRESHOLD and whose columns match."""
+    with _semantic_lock:
+        state = _semantic_index()
+        if not state or state["index"].ntotal == 0:
+            return ""
+        sig = _column_signature(raw_cols, ideal_cols)
+        vec = _embed_instructions(state["model"], instructions_text)
+        scores, ids = state["index"].search(vec, 5)
+        for score, i in zip(scores[0], ids[0]):
+            if i < 0 or score < SEMANTIC_THRESHOLD:
+                break
+            entry = state["meta"][i]
+            if entry["columns"] == sig:
+                plan_json = load_cached_plan(entry["key"])
+                if plan_json:
+                    return plan_json
+        return ""
+
+def remember_plan_embedding(raw_cols, ideal_cols, instructions_text: str, key: str):
+    """Add the instructions embedding for a freshly planned job and persist the index."""
+    with _semantic_lock:
+        state = _semantic_index()
+        if not state:
+            return
+        vec = _embed_instructions(state["model"], instructions_text)
+        state["index"].add(vec)
+        state["meta"].append({"key": key, "columns": _column_signature(raw_cols, ideal_cols)})
+        # meta first: a crash before the index lands leaves counts unequal, which the loader resets
+        _atomic_write_text(PLAN_CACHE_DIR / "index_meta.json", json.dumps(state["meta"]))
+        tmp_index = PLAN_CACHE_DIR / f"index.faiss.{uuid.uuid4().hex}.tmp"
+        state["faiss"].write_index(state["index"], str(tmp_index))
+        os.replace(tmp_index, PLAN_CACHE_DIR / "index.faiss")
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+_BULLET = re.compile(r"^\s*[•▪◦\-*](?:\s+|$)")
+_INSTRUCTION_KEYWORDS = re.compile(
+    r"(copy|concat|combine|fill|DOI|APC|price|round|decimal|license|year|date|fiscal|"
+    r"name|author|title|journal|affiliation|agreement|\bfy\b|\bacs\b|\boa\b)",
+    re.I,
+)
+_WORD = re.compile(r"[a-z0-9]{4,}")
+
+def _unwrap_lines(text: str) -> list:
+    """Re-join hard-wrapped lines: a line not ending in .!?: continues onto the next,
+    while bullet markers (and bullet-only lines) always start a new item."""
+    items, cur = [], ""
+    for line in text.splitlines():
+        is_bullet = bool(_BULLET.match(line))
+        line = _BULLET.sub("", line).strip()
+        if is_bullet or (cur and cur[-1] in ".!?:"):
+            if cur:
+                items.append(cur)
+            cur = ""
+        if line:
+            cur = f"{cur} {line}" if cur else line
+    if cur:
+        items.append(cur)
+    return items
+
+def _filter_instructions(text: str, raw_cols=(), ideal_cols=()) -> str:
+    """Keep only sentences that mention a mapping keyword or a RAW/IDEAL column word (fewer prompt tokens)."""
+    col_words = set()
+    for c in (*raw_cols, *ideal_cols):
+        col_words.update(_WORD.findall(str(c).lower()))
+    kept = []
+    for item in _unwrap_lines(text):
+        for sent in _SENTENCE_SPLIT.split(item):
+            low = sent.lower()
+            if _INSTRUCTION_KEYWORDS.search(sent) or any(w in low for w in col_words):
+                kept.append(sent)
+    # nothing recognisable: better to send everything than an empty instruction block
+    return "\n".join(kept) if kept else text
 
 def build_plan_prompt(raw_cols, ideal_cols, instructions_text: str) -> str:
     """
     Ask the model for a JSON plan instead of Python code.
     """
+    raw_cols = list(dict.fromkeys(map(str, raw_cols)))
+    ideal_cols = list(dict.fromkeys(map(str, ideal_cols)))
     return f"""
-You are a data standardization planner. Read the instructions and produce a concise JSON PLAN
-describing how to map RAW columns to IDEAL columns. Do NOT include any prose, ONLY JSON.
-
-JSON SCHEMA (strict):
-{{
-  "mappings": [
-    {{"op":"copy", "source":"<raw col>", "target":"<ideal col>"}},
-    {{"op":"concat", "sources":["<raw col A>", "<raw col B>"], "separator":" ", "target":"<ideal col>"}},
-    {{"op":"date_copy", "source":"<raw date col>", "target":"<ideal date col>"}},
-    {{"op":"calendar_year", "source":"<raw date col>", "target":"Calendar Year"}},
-    {{"op":"fiscal_year_july_june", "source":"<raw date col>", "target":"Fiscal Year"}},
-    {{"op":"numeric_copy", "source":"<raw numeric col>", "target":"<ideal col>", "decimals":2}},
-    {{"op":"fill_const", "value":"<constant string>", "target":"<ideal col>"}}
-  ],
-  "notes": ["any short notes about assumptions or skipped rules"]
-}}
+You are a data standardization planner. Output ONLY a compact JSON plan mapping RAW columns to IDEAL columns, no prose.
+
+Format: {{"mappings":[...],"notes":["short assumptions"]}}; each mapping has "op" plus fields:
+copy(source,target) | concat(sources[],separator,target) | date_copy(source,target) | calendar_year(source,target) | fiscal_year_july_june(source,target) | numeric_copy(source,target,decimals) | fill_const(value,target)
+Example: {{"op":"copy","source":"<raw col>","target":"<ideal col>"}}
 
 Rules:
-- Only use columns that exist in RAW/IDEAL when possible. If uncertain, include but the executor will skip missing ones.
-- If instructions mention ACS agreement string, include fill_const for "Agreement".
-- If instructions mention concat for names, use op "concat".
-- For date:
-  - Use "date_copy" for Publication Date copies.
-  - Use "calendar_year" for extracting year.
-  - Use "fiscal_year_july_june" for VIVA FY rule (FY = year + (month>=7)).
-- For APC or money fields, use "numeric_copy" with "decimals":2.
-- Keep JSON compact.
-
-RAW_COLUMNS = {list(map(str, raw_cols))}
-IDEAL_COLUMNS = {list(map(str, ideal_cols))}
-
-INSTRUCTIONS (verbatim):
+- Use RAW/IDEAL column names exactly; the executor skips missing ones.
+- ACS agreement string → fill_const "Agreement". Name concatenation → concat.
+- Publication Date → date_copy; year → calendar_year; VIVA FY (year + (month>=7)) → fiscal_year_july_june.
+- APC/money → numeric_copy with decimals 2.
+
+RAW_COLUMNS = {raw_cols}
+IDEAL_COLUMNS = {ideal_cols}
+
+INSTRUCTIONS:
 {instructions_text}
 """.strip()
 
+def resolve_plan(raw_cols, ideal_cols, instructions_text: str):
+    """
+    Get a JSON plan from the exact cache, the semantic cache, or the LLM (in that order).
+    Returns (plan_json, llm_out, steps[])
+    """
+    steps = []
+    llm_out = ""
+    cache_key = _plan_cache_key(raw_cols, ideal_cols, instructions_text)
+    plan_json = load_cached_plan(cache_key)
+    if plan_json:
+        steps.append("Reused cached JSON plan")
+        return plan_json, llm_out, steps
+
+    try:
+        plan_json = find_similar_plan(raw_cols, ideal_cols, instructions_text)
+    except Exception as e:
+        steps.append(f"[SEMANTIC_CACHE_ERROR] {e}")
+    if plan_json:
+        steps.append("Reused JSON plan from similar instructions")
+        save_cached_plan(cache_key, plan_json)
+        return plan_json, llm_out, steps
+
+    try:
+        instructions = _filter_instructions(instructions_text[:INSTRUCTIONS_MAX_CHARS], raw_cols, ideal_cols)
+        prompt = build_plan_prompt(raw_cols, ideal_cols, instructions)
+        llm_out = call_ollama(prompt)
+        plan_json = llm_out.strip()
+    except Exception as e:
+        steps.append(f"[AI_CALL_ERROR] {e}")
+        return plan_json, llm_out, steps
+
+    # only plans that parse and map something are worth replaying
+    if not _is_cacheable_plan(plan_json):
+        return plan_json, llm_out, steps
+    save_cached_plan(cache_key, plan_json)
+    try:
+        remember_plan_embedding(raw_cols, ideal_cols, instructions_text, cache_key)
+    except Exception as e:
+        steps.append(f"[SEMANTIC_CACHE_ERROR] {e}")
+    return plan_json, llm_out, steps
+
+_DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%Y-%m-%d %H:%M:%S", "%d-%b-%Y")
+
+def _sniff_date_format(value) -> str | None:
+    for fmt in _DATE_FORMATS:
+        try:
+            datetime.strptime(value.strip(), fmt)
+            return fmt
+        except ValueError:
+            continue
+    return None
+
 def safe_to_datetime(series):
-    s = pd.to_datetime(series, errors="coerce")
+    """to_datetime with fast paths: already-datetime columns pass through, and string
+    columns are parsed with an explicit format sniffed from the first value."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    non_null = series.dropna()
+    fmt = None
+    if not non_null.empty and isinstance(non_null.iloc[0], str):
+        fmt = _sniff_date_format(non_null.iloc[0])
+    if fmt is None:
+        return pd.to_datetime(series, errors="coerce", cache=True)
+    s = pd.to_datetime(series, format=fmt, errors="coerce", cache=True)
+    # rows in another layout than the sniffed one get the slower per-element parse
+    missed = s.isna() & series.notna()
+    if missed.any():
+        s[missed] = pd.to_datetime(series[missed], format="mixed", errors="coerce")
     return s
 
+def fiscal_year_july_june(years: np.ndarray, months: np.ndarray) -> np.ndarray:
+    """VIVA FY rule: FY = year + (month >= 7). NaT rows stay NaN."""
+    return years + (months >= 7).astype(np.int64)
+
 def apply_plan(plan: dict, raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
     """
     Execute the JSON plan deterministically with Pandas.
@@ -113,13 +382,42 @@ def apply_plan(plan: dict, raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
     def has(df, col): return col in df.columns
 
     mappings = plan.get("mappings", []) if isinstance(plan, dict) else []
+
+    # pass 1: group column-wise ops so each is computed once over all its sources
+    def sources_for(op):
+        out = []
+        for m in mappings:
+            try:
+                src = m.get("source")
+                if m.get("op") == op and has(raw_df, src) and src not in out:
+                    out.append(src)
+            except Exception:
+                pass  # reported per-mapping in pass 2
+        return out
+    copy_block = raw_df[sources_for("copy")]
+    numeric_block = raw_df[sources_for("numeric_copy")].apply(pd.to_numeric, errors="coerce")
+
+    # parse each date source once even if several ops (date/year/FY) read it
+    dt_cache = {}
+    def parsed_dates(src):
+        if src not in dt_cache:
+            dt_cache[src] = safe_to_datetime(raw_df[src])
+        return dt_cache[src]
+
+    # pass 2: collect {target: values} in plan order (later mappings win), assign once
+    batch = {}
+    def conform(values):
+        # align/broadcast to the template rows here, so a bad value fails only its own mapping
+        if isinstance(values, pd.Series):
+            return values.reindex(ideal_df.index)
+        return pd.Series(values, index=ideal_df.index)
     for m in mappings:
         try:
             op = m.get("op")
             if op == "copy":
                 src, tgt = m.get("source"), m.get("target")
                 if has(raw_df, src) and has(ideal_df, tgt):
-                    ideal_df[tgt] = raw_df[src]
+                    batch[tgt] = conform(copy_block[src])
                     steps.append(f'Mapped "{src}" → "{tgt}"')
                 else:
                     steps.append(f'Skipped copy "{src}"→"{tgt}" (missing col)')
@@ -127,13 +425,14 @@ def apply_plan(plan: dict, raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
             elif op == "concat":
                 srcs, sep, tgt = m.get("sources", []), m.get("separator", " "), m.get("target")
                 if all(has(raw_df, s) for s in srcs) and has(ideal_df, tgt):
-                    vals = [raw_df[s].fillna("").astype(str).str.strip() for s in srcs]
+                    vals = [raw_df[s].astype(ARROW_STRING).fillna("").str.strip() for s in srcs]
+                    # column-wise fold stays in Arrow kernels (no per-row Python loop)
                     out = vals[0]
                     for v in vals[1:]:
                         out = (out + sep + v).str.strip()
                     # normalize empty to NaN
-                    out = out.replace({"^\\s*$": None}, regex=True)
-                    ideal_df[tgt] = out
+                    out = out.mask(out.eq(""))
+                    batch[tgt] = conform(out)
                     steps.append(f'Concatenated {srcs} → "{tgt}"')
                 else:
                     steps.append(f'Skipped concat {srcs}→"{tgt}" (missing col)')
@@ -141,8 +440,8 @@ def apply_plan(plan: dict, raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
             elif op == "date_copy":
                 src, tgt = m.get("source"), m.get("target")
                 if has(raw_df, src) and has(ideal_df, tgt):
-                    dt = safe_to_datetime(raw_df[src])
-                    ideal_df[tgt] = dt.dt.date
+                    dt = parsed_dates(src)
+                    batch[tgt] = conform(dt.dt.date)
                     steps.append(f'Date copy "{src}" → "{tgt}"')
                 else:
                     steps.append(f'Skipped date_copy "{src}"→"{tgt}" (missing col)')
@@ -150,8 +449,8 @@ def apply_plan(plan: dict, raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
             elif op == "calendar_year":
                 src, tgt = m.get("source"), m.get("target")
                 if has(raw_df, src) and has(ideal_df, tgt):
-                    dt = safe_to_datetime(raw_df[src])
-                    ideal_df[tgt] = dt.dt.year
+                    dt = parsed_dates(src)
+                    batch[tgt] = conform(pd.Series(dt.dt.year.to_numpy(), index=raw_df.index))
                     steps.append(f'Calendar Year from "{src}" → "{tgt}"')
                 else:
                     steps.append(f'Skipped calendar_year "{src}"→"{tgt}" (missing col)')
@@ -159,8 +458,9 @@ def apply_plan(plan: dict, raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
             elif op == "fiscal_year_july_june":
                 src, tgt = m.get("source"), m.get("target")
                 if has(raw_df, src) and has(ideal_df, tgt):
-                    dt = safe_to_datetime(raw_df[src])
-                    ideal_df[tgt] = dt.dt.year + (dt.dt.month >= 7).astype("Int64")
+                    dt = parsed_dates(src)
+                    fy = fiscal_year_july_june(dt.dt.year.to_numpy(), dt.dt.month.to_numpy())
+                    batch[tgt] = conform(pd.Series(fy, index=raw_df.index))
                     steps.append(f'Fiscal Year (July–June) from "{src}" → "{tgt}"')
                 else:
                     steps.append(f'Skipped fiscal_year "{src}"→"{tgt}" (missing col)')
@@ -169,7 +469,7 @@ def apply_plan(plan: dict, raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
                 src, tgt = m.get("source"), m.get("target")
                 decimals = int(m.get("decimals", 2))
                 if has(raw_df, src) and has(ideal_df, tgt):
-                    ideal_df[tgt] = pd.to_numeric(raw_df[src], errors="coerce").round(decimals)
+                    batch[tgt] = conform(numeric_block[src].round(decimals))
                     steps.append(f'Numeric copy "{src}" → "{tgt}" (round {decimals})')
                 else:
                     steps.append(f'Skipped numeric_copy "{src}"→"{tgt}" (missing col)')
@@ -177,7 +477,7 @@ def apply_plan(plan: dict, raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
             elif op == "fill_const":
                 val, tgt = m.get("value"), m.get("target")
                 if has(ideal_df, tgt):
-                    ideal_df[tgt] = val
+                    batch[tgt] = conform(val)
                     steps.append(f'Filled constant "{val}" → "{tgt}"')
                 else:
                     steps.append(f'Skipped fill_const "{val}"→"{tgt}" (missing col)')
@@ -187,6 +487,11 @@ def apply_plan(plan: dict, raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
         except Exception as e:
             steps.append(f"[PLAN_APPLY_ERROR] {e}")
 
+    if batch:
+        # fresh frame in template column order; ideal_df itself is never mutated
+        columns = {c: batch[c] if c in batch else ideal_df[c] for c in ideal_df.columns}
+        ideal_df = pd.DataFrame(columns, index=ideal_df.index)
+
     return ideal_df, steps
 
 def apply_fallback_acs(raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
@@ -206,9 +511,10 @@ def apply_fallback_acs(raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
 
     if all(has(raw_df, c) for c in ["Corresponding Author First Name", "Corresponding Author Last Name"]) \
        and "Author Name" in ideal_df.columns:
-        first = raw_df["Corresponding Author First Name"].fillna("").astype(str)
-        last  = raw_df["Corresponding Author Last Name"].fillna("").astype(str)
-        ideal_df["Author Name"] = (first.str.strip() + " " + last.str.strip()).str.strip().replace({"^\\s*$": None}, regex=True)
+        first = raw_df["Corresponding Author First Name"].astype(ARROW_STRING).fillna("")
+        last  = raw_df["Corresponding Author Last Name"].astype(ARROW_STRING).fillna("")
+        name = (first.str.strip() + " " + last.str.strip()).str.strip()
+        ideal_df["Author Name"] = name.mask(name.eq(""))
         steps.append("Corresponding Author First/Last → Author Name")
 
     if has(raw_df, "Manuscript Title Text") and "Article Title" in ideal_df.columns:
@@ -220,15 +526,17 @@ def apply_fallback_acs(raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
         steps.append("Journal Title Name → Journal Title")
 
     if has(raw_df, "ASAP Pub Date"):
-        dt = pd.to_datetime(raw_df["ASAP Pub Date"], errors="coerce")
+        dt = safe_to_datetime(raw_df["ASAP Pub Date"])
+        years = dt.dt.year.to_numpy()
+        months = dt.dt.month.to_numpy()
         if "Publication Date" in ideal_df.columns:
             ideal_df["Publication Date"] = dt.dt.date
             steps.append("ASAP Pub Date → Publication Date")
         if "Calendar Year" in ideal_df.columns:
-            ideal_df["Calendar Year"] = dt.dt.year
+            ideal_df["Calendar Year"] = pd.Series(years, index=raw_df.index)
             steps.append("Calendar Year from ASAP Pub Date")
         if "Fiscal Year" in ideal_df.columns:
-            ideal_df["Fiscal Year"] = dt.dt.year + (dt.dt.month >= 7).astype("Int64")
+            ideal_df["Fiscal Year"] = pd.Series(fiscal_year_july_june(years, months), index=raw_df.index)
             steps.append("Fiscal Year (July–June) from ASAP Pub Date")
 
     if has(raw_df, "Transacting Profile Name") and "Author Affiliation" in ideal_df.columns:
@@ -249,6 +557,43 @@ def apply_fallback_acs(raw_df: pd.DataFrame, ideal_df: pd.DataFrame):
 
     return ideal_df, steps
 
+def write_xlsx(df: pd.DataFrame, path: Path):
+    """
+    Stream df to .xlsx row by row with xlsxwriter's constant_memory mode.
+    (pandas' to_excel writes column by column, which constant_memory silently truncates.)
+    """
+    wb = xlsxwriter.Workbook(str(path), {
+        "constant_memory": True,
+        "strings_to_urls": False,
+        "strings_to_formulas": False,
+        "remove_timezone": True,
+    })
+    ws = wb.add_worksheet()
+    header_fmt = wb.add_format({"bold": True, "border": 1, "align": "center"})
+    date_fmt = wb.add_format({"num_format": "yyyy-mm-dd"})
+    datetime_fmt = wb.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+
+    ws.write_row(0, 0, [str(c) for c in df.columns], header_fmt)
+    for r, row in enumerate(df.itertuples(index=False, name=None), start=1):
+        for c, v in enumerate(row):
+            if isinstance(v, str):
+                ws.write_string(r, c, v)
+                continue
+            if pd.api.types.is_scalar(v) and pd.isna(v):
+                continue
+            if isinstance(v, datetime):
+                ws.write_datetime(r, c, v, datetime_fmt)
+            elif isinstance(v, date):
+                ws.write_datetime(r, c, v, date_fmt)
+            else:
+                if isinstance(v, np.generic):
+                    v = v.item()
+                try:
+                    ws.write(r, c, v)
+                except TypeError:
+                    ws.write_string(r, c, str(v))
+    wb.close()
+
 # ---------- process (save inputs) ----------
 @app.post("/process")
 async def process_files(
@@ -260,13 +605,16 @@ async def process_files(
     job_dir = JOBS_DIR / job_id
     job_dir.mkdir(parents=True, exist_ok=True)
 
-    def save(upload: UploadFile, name: str):
-        with open(job_dir / name, "wb") as f:
-            shutil.copyfileobj(upload.file, f)
+    async def save(upload: UploadFile, name: str):
+        async with aiofiles.open(job_dir / name, "wb") as f:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                await f.write(chunk)
 
-    save(ideal, "ideal_upload.xlsx")
-    save(raw, "raw_upload.xlsx")
-    save(instructions, instructions.filename or "instructions_upload")
+    await asyncio.gather(
+        save(ideal, "ideal_upload.xlsx"),
+        save(raw, "raw_upload.xlsx"),
+        save(instructions, instructions.filename or "instructions_upload"),
+    )
 
     return JSONResponse({
         "jobId": job_id,
@@ -280,47 +628,16 @@ async def process_files(
     })
 
 # ---------- finalize (AI JSON plan → deterministic executor, with fallback) ----------
-@app.post("/finalize/{job_id}")
-def finalize(job_id: str):
-    job_dir = JOBS_DIR / job_id
-    if not job_dir.exists():
-        return JSONResponse({"error": "job not found"}, status_code=404)
-
-    raw_path = job_dir / "raw_upload.xlsx"
-    ideal_path = job_dir / "ideal_upload.xlsx"
-    if not raw_path.exists() or not ideal_path.exists():
-        return JSONResponse({"error": "missing input files"}, status_code=400)
-
-    # 1) read instructions to text file
-    instr_text = read_instructions_text(job_dir)
-    (job_dir / "instructions.txt").write_text(instr_text)
-
-    # 2) load sheets
-    raw_df = pd.read_excel(raw_path)
-    ideal_df = pd.read_excel(ideal_path)
-    if len(ideal_df) == 0 and not raw_df.empty:
-        ideal_df = pd.DataFrame(columns=ideal_df.columns, index=range(len(raw_df)))
-
-    # 3) ask LLM for a JSON plan
-    ai_steps = []
-    plan_json = ""
-    try:
-        prompt = build_plan_prompt(raw_df.columns.tolist(), ideal_df.columns.tolist(), instr_text[:4000])
-        llm_out = call_ollama(prompt)
-        plan_json = extract_json_block(llm_out)
-    except Exception as e:
-        ai_steps.append(f"[AI_CALL_ERROR] {e}")
+def execute_plan_and_write(job_dir: Path, raw_df: pd.DataFrame, ideal_df: pd.DataFrame, plan_json: str, ai_steps: list):
+    """Apply the plan (or ACS fallback) and write ideal_filled.xlsx, transform_log.yaml, summary.json."""
+    before_counts = ideal_df.notna().sum()
 
-    # Save raw model output and extracted plan
-    (job_dir / "plan_raw.txt").write_text(llm_out if 'llm_out' in locals() else "")
-    (job_dir / "plan.json").write_text(plan_json or "{}")
-
-    # 4) parse and apply plan
-    new_ideal_df = ideal_df.copy()
+    # 4) parse and apply plan (apply_plan returns a new frame, no defensive copy needed)
+    new_ideal_df = ideal_df
     if plan_json:
         try:
             plan = json.loads(plan_json)
-            new_ideal_df, plan_steps = apply_plan(plan, raw_df, new_ideal_df)
+            new_ideal_df, plan_steps = apply_plan(plan, raw_df, ideal_df)
             ai_steps.extend(plan_steps)
         except Exception as e:
             ai_steps.append(f"[PLAN_PARSE_ERROR] {e}")
@@ -328,11 +645,9 @@ def finalize(job_id: str):
         ai_steps.append("No JSON plan extracted")
 
     # 5) if AI didn’t improve anything, fallback to ACS rules
-    def nonnull_counts(df):
-        return {c: int(df[c].notna().sum()) for c in df.columns}
-    before_counts = nonnull_counts(ideal_df)
-    after_counts  = nonnull_counts(new_ideal_df)
-    changed = any(after_counts.get(c, 0) > before_counts.get(c, 0) for c in new_ideal_df.columns)
+    cols = new_ideal_df.columns
+    after_counts = new_ideal_df.notna().sum()
+    changed = bool((after_counts.reindex(cols, fill_value=0) > before_counts.reindex(cols, fill_value=0)).any())
 
     if not changed:
         fb_df, fb_steps = apply_fallback_acs(raw_df, ideal_df)
@@ -342,7 +657,7 @@ def finalize(job_id: str):
 
     # 6) outputs
     final_ideal = job_dir / "ideal_filled.xlsx"
-    new_ideal_df.to_excel(final_ideal, index=False)
+    write_xlsx(new_ideal_df, final_ideal)
 
     (job_dir / "transform_log.yaml").write_text(
         "steps:\n" + "\n".join(f"  - {s}" for s in ai_steps)
@@ -355,7 +670,96 @@ def finalize(job_id: str):
         "notes": "AI JSON plan executed deterministically; ACS fallback used if plan had no effect."
     }, indent=2))
 
-    return {"jobId": job_id, "status": "finalized", "message": "AI plan executed (w/ fallback if needed)"}
+async def run_finalize(job_dir: Path):
+    """Full finalize pipeline for one job: instructions → plan → executor → output files."""
+    raw_path = job_dir / "raw_upload.xlsx"
+    ideal_path = job_dir / "ideal_upload.xlsx"
+
+    # diagnostics (not served by /download) are written in the background, but always
+    # awaited, so plan.json/plan_raw.txt exist even when the executor fails
+    diag_writes = []
+    try:
+        # 1) instructions text + both sheets, read concurrently. Each workbook is parsed once:
+        #    a separate header-only read costs almost as much as the full read (the whole
+        #    sheet is loaded either way), which dominated latency on plan-cache hits.
+        instr_text, raw_df, ideal_df = await asyncio.gather(
+            asyncio.to_thread(read_instructions_text, job_dir),
+            asyncio.to_thread(pd.read_excel, raw_path, engine=EXCEL_ENGINE),
+            asyncio.to_thread(pd.read_excel, ideal_path, engine=EXCEL_ENGINE),
+        )
+        diag_writes.append(asyncio.create_task(asyncio.to_thread((job_dir / "instructions.txt").write_text, instr_text)))
+        if len(ideal_df) == 0 and not raw_df.empty:
+            ideal_df = pd.DataFrame(columns=ideal_df.columns, index=range(len(raw_df)))
+
+        # 2) get the JSON plan (cache or LLM); raw model output and plan are saved in the background
+        plan_json, llm_out, ai_steps = await asyncio.to_thread(
+            resolve_plan, raw_df.columns.tolist(), ideal_df.columns.tolist(), instr_text
+        )
+        diag_writes += [
+            asyncio.create_task(asyncio.to_thread((job_dir / "plan_raw.txt").write_text, llm_out)),
+            asyncio.create_task(asyncio.to_thread((job_dir / "plan.json").write_text, plan_json or "{}")),
+        ]
+
+        # 3) pandas work + output files are blocking; keep them off the event loop
+        await asyncio.to_thread(execute_plan_and_write, job_dir, raw_df, ideal_df, plan_json, ai_steps)
+    finally:
+        for result in await asyncio.gather(*diag_writes, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.warning("diagnostic write failed in %s: %s", job_dir.name, result)
+
+def write_status(job_dir: Path, status: dict):
+    _atomic_write_text(job_dir / "status.json", json.dumps(status))
+
+async def job_worker(queue: asyncio.Queue):
+    """Single consumer: runs one finalize at a time, matching Ollama's single execution slot."""
+    while True:
+        job_id = await queue.get()
+        job_dir = JOBS_DIR / job_id
+        try:
+            write_status(job_dir, {"status": "running"})
+            await run_finalize(job_dir)
+            write_status(job_dir, {"status": "finalized", "message": "AI plan executed (w/ fallback if needed)"})
+        except Exception as e:
+            logger.exception("finalize failed for job %s", job_id)
+            # e.g. job dir deleted while queued: nothing to report to, but the worker must survive
+            try:
+                write_status(job_dir, {"status": "failed", "error": str(e)})
+            except Exception:
+                logger.exception("could not write failed status for job %s", job_id)
+        finally:
+            queue.task_done()
+
+def fail_interrupted_jobs():
+    """Jobs still queued/running from a previous process will never be picked up again."""
+    for status_path in JOBS_DIR.glob("*/status.json"):
+        try:
+            status = json.loads(status_path.read_text())
+            if status.get("status") in ("queued", "running"):
+                write_status(status_path.parent, {"status": "failed", "error": "interrupted by service restart"})
+        except Exception:
+            logger.exception("could not check status of %s", status_path.parent.name)
+
+@app.on_event("startup")
+async def start_job_worker():
+    fail_interrupted_jobs()
+    app.state.job_queue = asyncio.Queue()
+    app.state.job_worker = asyncio.create_task(job_worker(app.state.job_queue))
+
+@app.post("/finalize/{job_id}")
+async def finalize(job_id: str):
+    job_dir = JOBS_DIR / job_id
+    if not job_dir.exists():
+        return JSONResponse({"error": "job not found"}, status_code=404)
+
+    raw_path = job_dir / "raw_upload.xlsx"
+    ideal_path = job_dir / "ideal_upload.xlsx"
+    if not raw_path.exists() or not ideal_path.exists():
+        return JSONResponse({"error": "missing input files"}, status_code=400)
+
+    # queue it; /download answers 202 until the worker marks the job finalized
+    write_status(job_dir, {"status": "queued"})
+    await app.state.job_queue.put(job_id)
+    return JSONResponse({"jobId": job_id, "status": "queued"}, status_code=202)
 
 # ---------- download ----------
 @app.get("/download/{job_id}/{kind}")
@@ -367,6 +771,16 @@ def download(job_id: str, kind: str):
         "summary": job_dir / "summary.json",
     }
     path = mapping.get(kind)
-    if not path or not path.exists():
+    if not path:
+        return JSONResponse({"error": "file not ready"}, status_code=404)
+    # jobs finalized before the queue existed have no status.json; serve their files as-is
+    status_path = job_dir / "status.json"
+    if status_path.exists():
+        status = json.loads(status_path.read_text())
+        if status["status"] in ("queued", "running"):
+            return JSONResponse({"jobId": job_id, "status": status["status"]}, status_code=202)
+        if status["status"] == "failed":
+            return JSONResponse({"error": status.get("error", "finalize failed")}, status_code=500)
+    if not path.exists():
         return JSONResponse({"error": "file not ready"}, status_code=404)
     return FileResponse(path)
@@ -1,5 +1,23 @@
 import { useState } from 'react';
 
+const POLL_MS = 1000;
+const MAX_POLLS = 600; // ~10 minutes
+
+class PollTimeoutError extends Error {}
+
+async function waitUntilReady(url) {
+  for (let i = 0; i < MAX_POLLS; i++) {
+    const res = await fetch(url);
+    if (res.status === 202) {
+      await new Promise(r => setTimeout(r, POLL_MS));
+      continue;
+    }
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    return;
+  }
+  throw new PollTimeoutError('Timed out waiting for the job to finish');
+}
+
 export default function Home() {
   const [idealFile, setIdealFile] = useState(null);
   const [rawFile, setRawFile] = useState(null);
@@ -27,6 +45,10 @@ export default function Home() {
       if (!res.ok) throw new Error(`HTTP ${res.status}`);
       const data = await res.json();
 
+      // job is queued on the AI service; downloads answer 202 until it is finalized
+      setMsg('Queued… generating your sheet.');
+      await waitUntilReady(`http://localhost:8080${data.summaryUrl}`);
+
       setMsg('Done! Downloads ready below.');
       setDownlinks({
         idealUrl: `http://localhost:8080${data.idealUrl}`,
@@ -35,7 +57,9 @@ export default function Home() {
       });
     } catch (err) {
       console.error(err);
-      setMsg('Failed to process. Please try again.');
+      setMsg(err instanceof PollTimeoutError
+        ? 'Still not finished after 10 minutes. Please try again later.'
+        : 'Failed to process. Please try again.');
     } finally {
       setLoading(false);
     }
@@ -41,6 +41,11 @@ public class ProcessController {
 
         var resp = restTemplate.getForEntity(url, byte[].class);
 
+        // 202 while the job is queued/running: pass the JSON status through for the frontend to poll
+        if (resp.getStatusCode().value() == 202) {
+            return ResponseEntity.status(202).contentType(MediaType.APPLICATION_JSON).body(resp.getBody());
+        }
+
         MediaType ct = switch (type) {
             case "ideal" -> MediaType.parseMediaType("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet");
             case "log" -> MediaType.TEXT_PLAIN;
@@ -96,11 +101,11 @@ public class ProcessController {
         JsonNode node = om.readTree(aiResponse.getBody());
         String aiJobId = node.get("jobId").asText();
 
-        // Auto-finalize so downloads are ready
+        // Auto-finalize: the AI service queues the job and answers 202 right away
         String finalizeUrl = "http://localhost:8001/finalize/" + aiJobId;
         restTemplate.postForEntity(finalizeUrl, null, String.class);
 
-        // Return ready download links (via Spring proxy)
+        // Return download links (via Spring proxy); they answer 202 until the job is finalized
         return ResponseEntity.ok(Map.of(
                 "jobId", aiJobId,
                 "idealUrl", "/api/download/" + aiJobId + "/ideal",